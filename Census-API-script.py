@@ -26,9 +26,11 @@
 # 2. If that works, then type in “<span style="color:red">activate py39</span>” and press Enter. 
 # 3. Then type in “<span style="color:red">conda install geopandas</span>” and hit enter. 
 # 
-# Also, you will need to perform a pip install for <span style="color:red">census</span>, <span style="color:red">us</span>, and <span style="color:red">PyGithub</span> to use those libraries
+# Also, you will need to perform a pip install for <span style="color:red">us</span>, <span style="color:red">pyogrio</span>, <span style="color:red">pyarrow</span>, <span style="color:red">requests</span>, <span style="color:red">orjson</span>, and <span style="color:red">mapclassify</span> to use those libraries.  GeoPandas will use <span style="color:red">pyogrio</span> (instead of <span style="color:red">fiona</span>) to read and write spatial files, which moves whole columns of data through GDAL at once instead of one feature at a time
 # 
 # And make sure you have the latest shapely library installed.  If not, you will need to upgrade it (<span style="color:red">conda install shapely</span>)
+# 
+# Throughout the workshop we print the first rows of each dataframe to check our work.  Printing a dataframe with geometries means writing out every boundary as text, which takes a surprisingly long time, so these printouts only happen when <span style="color:red">DEBUG</span> is <span style="color:red">True</span>.  Set the <span style="color:red">CENSUS_DEBUG</span> environment variable to 1 before starting Jupyter (or just change the line to <span style="color:red">DEBUG = True</span>) to see them; leave it off when you run the script on its own.
 
 # In[1]:
 
@@ -37,33 +39,49 @@
 import matplotlib.pyplot as plt # plotting tool
 import pandas as pd # data analysis and manipulation tool
 import geopandas as gpd # extends the datatypes used by pandas to allow spatial operations on geometric types
-from shapely.geometry import Polygon # for geometric operations
-from census import Census # library for accessing census tables
+import numpy as np # fast arrays of numbers
+import shapely # vectorized geometric operations (shapely 2.0 or newer)
+from shapely.errors import GEOSException # error shapely raises when a geometric operation fails
 from us import states # library for accessing the FIPS codes for many geographies
-import fiona # for file access 
-import base64 # provides functions for encoding/decoding binary data to printable ASCII
-from github.MainClass import Github, GithubIntegration # main class to access the Github API v3
-from github.InputGitTreeElement import InputGitTreeElement # This class represents InputGitTreeElements(path, mode, type, content, sha)
+import pyogrio # for fast, column-oriented file access through GDAL
+from pyogrio.errors import DataSourceError, DataLayerError # errors pyogrio raises when a file cannot be opened or written
 import os #  provides functions for interacting with the underlying operating system
+import requests # for talking to web APIs over HTTP
+from requests.adapters import HTTPAdapter # for setting up connection reuse and retries
+import orjson # fast JSON parser
+import hashlib # for turning a download link into a short, file-friendly name
+import itertools # for chaining lists together
+from concurrent.futures import ThreadPoolExecutor, as_completed # for running independent tasks at the same time
+from pathlib import Path # for building file paths that work on every operating system
+import importlib.util # for checking whether an optional library is installed without importing it
+
+# Read and write spatial files with pyogrio
+gpd.options.io_engine = "pyogrio"
+
+# Folder where downloaded data is kept between runs
+CACHE_DIR = Path.home() / ".cache" / "census"
+
+# Print the dataframes along the way only when asked to (set the CENSUS_DEBUG environment variable to 1)
+DEBUG = os.environ.get("CENSUS_DEBUG") == "1"
 
 
 # In[2]:
 
 
 # You can ignore this, but if you want to see a list of all spatial data types that are supported, just remove the hashtag
-# fiona.supported_drivers
+# pyogrio.list_drivers()
 
 
 # In[3]:
 
 
-# pip install PyGithub
+# pip install pyogrio pyarrow requests orjson mapclassify
 
 
 # In[4]:
 
 
-# pip install census
+# pip install datashader (optional, speeds up maps with many thousands of shapes)
 
 
 # In[5]:
@@ -82,74 +100,214 @@ import os #  provides functions for interacting with the underlying operating sy
 # 4. You will receive an email with your key code in the message and a link to register it.
 # 
 # ### <span style="color:green">NOTE: Keep your API key private!  I used mine to test my script, but I've removed it from below.</span>
+# 
+# We will talk to the API with a <span style="color:red">requests</span> session.  The session keeps the connection to the Census Bureau open between requests, asks for compressed responses (so less data travels over the network), and tries again if a request fails along the way.
 
 # In[6]:
 
 
 # Set API key
-c = Census("Enter your 40 digit text string here")
+CENSUS_API_KEY = "Enter your 40 digit text string here"
+
+# Send every request through one session: it keeps the connection open, asks for compressed (gzip) responses,
+# and tries again up to 3 times if a request fails along the way
+# Source: https://requests.readthedocs.io/en/latest/user/advanced/#transport-adapters
+session = requests.Session()
+session.headers["Accept-Encoding"] = "gzip"
+session.mount("https://", HTTPAdapter(pool_connections = 1, pool_maxsize = 8, max_retries = 3))
 
 
-# Now access the census data at the tract level for New York State from the 2020 ACS.  The tables you are looking for are the ratio of income to poverty in the past 12 months <b>(C17002_001E, total; C17002_002E, < 0.50; and C17002_003E, 0.50 - 0.99)</b> variables and total population <b>(B01003_001E)</b>. For more information on why these variables are used, refer to the US Census Bureau’s article on [How the Census Bureau measures poverty](https://www.census.gov/topics/income-poverty/poverty/guidance/poverty-measures.html) and [the 2020 list of variables found in ACS](https://api.census.gov/data/2020/acs/acs5/variables.html).
+# Now access the census data at the tract level for New York State from the 2020 ACS.  The tables you are looking for are the ratio of income to poverty in the past 12 months <b>(C17002_002E, < 0.50; and C17002_003E, 0.50 - 0.99)</b> variables and total population <b>(B01003_001E)</b>. For more information on why these variables are used, refer to the US Census Bureau’s article on [How the Census Bureau measures poverty](https://www.census.gov/topics/income-poverty/poverty/guidance/poverty-measures.html) and [the 2020 list of variables found in ACS](https://api.census.gov/data/2020/acs/acs5/variables.html).
+# 
+# The API lets us ask for geographic data through an FIPS code (36 for New York): <span style="color:red">for=tract:*&in=state:36 county:*</span> means "every tract, in every county, in state 36", so the whole state comes back from a single request.  If you only want some counties, you can pass <span style="color:red">get_census_tracts</span> a county FIPS code or a list of them instead (for example <span style="color:red">county_fips = ["005", "047", "061", "081", "085"]</span> for the five boroughs of New York City).  It then asks for each county separately, but sends up to 8 requests at the same time, so you mostly wait for the slowest one instead of all of them in a row.  We can use the <span style="color:red">us</span> library to help us figure out the relevant FIPS code if we want to analyze other geographies.  Note that we are using the 2020 ACS to access data from 2019.
+# 
+# (There is also a <span style="color:red">census</span> package that wraps this API.  We call the API directly instead, because the package makes an extra request for every variable to look up its data type, and turns each row into a Python dictionary before we get to see it.  The API answers with JSON text, which we read with <span style="color:red">orjson</span>, a much faster JSON parser than the one built into Python.)
 # 
-# The <span style="color:red">census</span> package provides us with methods to obtain geographic data through an FIPS code (36 for New York).  We can also use the <span style="color:red">us</span> library to help us figure out the relevant FIPS code if we want to analyze other geographies.  Note that we are using the 2020 ACS to access data from 2019.
+# If you forget to put in your API key (or it hasn't been activated yet), the API answers with a web page saying "Invalid Key" instead of data, and <span style="color:red">get_census_tracts</span> stops with an error telling you to check <span style="color:red">CENSUS_API_KEY</span>.
+# 
+# The data for a given year and state doesn't change, so <span style="color:red">get_census_tracts</span> saves what it gets from the API as a [parquet](https://pandas.pydata.org/docs/reference/api/pandas.DataFrame.to_parquet.html) file in <span style="color:red">CACHE_DIR</span>, named after the year, state, and variables you asked for.  Later runs read that file back in a few milliseconds instead of calling the API again.  It also stores the counts as 32-bit whole numbers (<span style="color:red">int32</span>), which is plenty for any census count and lets pandas do the math later on with fast, compact number columns instead of generic Python objects.  Sometimes the API leaves an estimate empty (<span style="color:red">null</span>), for example when the Census Bureau doesn't publish it for a small area; those are kept as missing values (<span style="color:red">&lt;NA&gt;</span>).  In Step 8, a tract with any of its counts missing is left out of all three county totals (otherwise its population would count towards the poverty rate without its poverty counts, making the rate look too low), and a county where no tract has all its counts gets no poverty rate at all (<span style="color:red">NaN</span>).
 
 # In[7]:
 
 
 # Obtain Census variables from the 2020 ACS at the tract level for the State of New York (FIPS code: 36)
-# C17002_001E: count of ratio of income to poverty in the past 12 months (total)
 # C17002_002E: count of ratio of income to poverty in the past 12 months (< 0.50)
 # C17002_003E: count of ratio of income to poverty in the past 12 months (0.50 - 0.99)
 # B01003_001E: total population
-# Sources: https://api.census.gov/data/2020/acs/acs5/variables.html; https://pypi.org/project/census/
-ny_census = c.acs5.state_county_tract(fields = ('NAME', 'C17002_001E', 'C17002_002E', 'C17002_003E', 'B01003_001E'),
-                                      state_fips = states.NY.fips,
-                                      county_fips = "*",
-                                      tract = "*",
-                                      year = 2019)
-
-
-# Now that we have accessed the data and assigned it to a variable, we can read the data into a dataframe using the pandas library.  This is NOT the geodataframe.  That comes later.
+ACS5_URL = "https://api.census.gov/data/{}/acs/acs5"
+
+
+def _atomic_write(path, write_fn):
+    """Create path by calling write_fn on a temporary name, then move the finished file into place."""
+    # Write to a temporary name first so an interrupted run never leaves a broken copy behind
+    # Source: https://docs.python.org/3/library/pathlib.html#pathlib.Path.replace
+    path.parent.mkdir(parents = True, exist_ok = True)
+    partial_path = path.with_suffix(".partial" + path.suffix)
+    write_fn(partial_path)
+    partial_path.replace(path)
+
+
+def _get_acs_rows(fields, state_fips, county_fips, year):
+    """Ask the ACS 5-year API for every tract in one county (or every county, with "*"), returning (header, rows)."""
+    # Sources: https://www.census.gov/data/developers/guidance/api-user-guide.html; https://api.census.gov/data/2020/acs/acs5/variables.html
+    response = session.get(ACS5_URL.format(year),
+                           params = {"get": ",".join(fields),
+                                     "for": "tract:*",
+                                     "in": "state:{} county:{}".format(state_fips, county_fips),
+                                     "key": CENSUS_API_KEY},
+                           timeout = 30)
+    response.raise_for_status()
+
+    # When there is nothing to send back (for example, a county with no tracts), the API answers with no content at all
+    if response.status_code == 204 or not response.content:
+        return [*fields, "state", "county", "tract"], []
+
+    # The API answers with a list of rows; the first row holds the column names
+    # If the key is wrong, it sends back a web page saying "Invalid Key" instead (still marked as a success)
+    try:
+        header, *rows = orjson.loads(response.content)
+    except orjson.JSONDecodeError:
+        raise ValueError("The Census API did not send back any data. Check that CENSUS_API_KEY is set to your own, "
+                         "registered API key (the text of its answer started with: {!r})".format(response.text[:100])) from None
+    return header, rows
+
+
+def _count_column(rows, i):
+    """Column i of the API rows as 32-bit whole numbers, with estimates the API leaves empty (null) as missing values."""
+    values = [row[i] for row in rows]
+    if None in values:
+        # Source: https://pandas.pydata.org/docs/user_guide/integer_na.html
+        return pd.array([None if value is None else int(value) for value in values], dtype = "Int32")
+    # Source: https://numpy.org/doc/stable/reference/generated/numpy.fromiter.html
+    return np.fromiter(map(int, values), dtype = np.int32, count = len(values))
+
+
+def get_census_tracts(fields, state_fips, year, county_fips = "*"):
+    """Get ACS 5-year variables for the census tracts of a state, keeping a parquet copy in CACHE_DIR for later runs."""
+    # Accept a single county code ("005") as well as a list of them
+    if isinstance(county_fips, str) and county_fips != "*":
+        county_fips = [county_fips]
+    if county_fips != "*":
+        county_fips = tuple(county_fips)
+        if not county_fips:
+            raise ValueError("county_fips must be \"*\", a county FIPS code, or a non-empty list of county FIPS codes")
+    key = hashlib.md5(repr((year, state_fips, county_fips, tuple(fields))).encode()).hexdigest()
+    cache_path = CACHE_DIR / "census_{}.parquet".format(key)
+    if cache_path.exists():
+        return pd.read_parquet(cache_path)
+
+    if county_fips == "*":
+        # Ask for every tract in every county of the state in a single request
+        header, rows = _get_acs_rows(fields, state_fips, "*", year)
+    else:
+        # Ask for each county separately, several at a time over the shared session
+        # Source: https://docs.python.org/3/library/concurrent.futures.html#threadpoolexecutor
+        with ThreadPoolExecutor(max_workers = 8) as pool:
+            results = list(pool.map(lambda county: _get_acs_rows(fields, state_fips, county, year), county_fips))
+        header = results[0][0]
+        rows = list(itertools.chain.from_iterable(county_rows for _, county_rows in results))
+
+    # Create a dataframe from the census data one column at a time, storing the counts as 32-bit whole numbers
+    # Each count column is filled straight into an array of the right size and type, so pandas gets ready-made
+    # typed arrays instead of having to inspect every row and guess the data types
+    counts = {field for field in fields if field != "NAME"}
+    df = pd.DataFrame({name: _count_column(rows, i) if name in counts
+                             else [row[i] for row in rows]
+                       for i, name in enumerate(header) if name not in ("state", "county", "tract")})
+
+    # Combine the state, county, and tract codes of each row into its GEOID (the key of the shapefile) as a category
+    state_i, county_i, tract_i = (header.index(name) for name in ("state", "county", "tract"))
+    df["GEOID"] = pd.Categorical([row[state_i] + row[county_i] + row[tract_i] for row in rows])
+
+    _atomic_write(cache_path, df.to_parquet)
+    return df
+
+
+# The survey year and variables we use
+YEAR = 2019
+FIELDS = ('C17002_002E', 'C17002_003E', 'B01003_001E')
+
+ny_df = get_census_tracts(FIELDS, states.NY.fips, YEAR)
+
+
+# Now that we have accessed the data, <span style="color:red">get_census_tracts</span> has read it into a dataframe using the pandas library for us.  This is NOT the geodataframe.  That comes later.
 
 # In[8]:
 
 
-# Create a dataframe from the census data
-ny_df = pd.DataFrame(ny_census)
-
-# Show the dataframe
-print(ny_df.head(5))
-print('Shape: ', ny_df.shape)
+if DEBUG:
+    # Show the dataframe
+    print(ny_df.head(5))
+    print('Shape: ', ny_df.shape)
 
 
-# ### By showing the dataframe, we can see that there are 4918 rows (i.e. 4918 census tracts) and 8 columns.
+# ### By showing the dataframe, we can see that there are 4918 rows (i.e. 4918 census tracts) and 4 columns.
 # 
 # 
 # ## Step 3: Import Shapefile
 # 
-# Let’s also read into Python a 2019 shapefile (so that the number of rows match) of the New York census tracts.  This shapefile can be downloaded on the Census Bureau’s website on the [Cartographic Boundary Files page](https://www.census.gov/geographies/mapping-files/time-series/geo/cartographic-boundary.html) or the [TIGER/Line Shapefiles page](https://www.census.gov/geographies/mapping-files/time-series/geo/tiger-line-file.html).)  However, we are just going to access it from where it lives on the web. 
+# Let’s also read into Python a 2019 shapefile (so that the number of rows match) of the New York census tracts.  This shapefile can be downloaded on the Census Bureau’s website on the [Cartographic Boundary Files page](https://www.census.gov/geographies/mapping-files/time-series/geo/cartographic-boundary.html) or the [TIGER/Line Shapefiles page](https://www.census.gov/geographies/mapping-files/time-series/geo/tiger-line-file.html).)  However, we are just going to access it from where it lives on the web.  We only ask for the columns we need (<span style="color:red">columns = [...]</span>), so the other TIGER attributes are never read.
 # 
-# We're also going to reproject the spatial data into the UTM Zone 18N (also known as EPSG 32618) projection (because this will allow us to project the entire state of New York, instead of just a particular section). 
+# Downloading the shapefile takes longer than anything else in this step, and the file doesn't change, so <span style="color:red">read_cached_file</span> only downloads it the first time.  The zipped shapefile is downloaded into the <span style="color:red">CACHE_DIR</span> folder (through the same <span style="color:red">requests</span> session we set up in Step 2) and kept there.  <span style="color:red">read_cached_file</span> then saves a copy of the tracts as a [GeoParquet](https://geoparquet.org/) file in the <span style="color:red">CACHE_DIR</span> folder (named after the link and the columns, so different files don't overwrite each other) and reads that copy on every later run.  GeoParquet stores each column (including the geometry) as one compact block, so reading it back skips the slow parsing of the shapefile's attribute table.  Delete the folder if you ever want a fresh download.
+# 
+# Right after reading the tracts, we make their <span style="color:red">GEOID</span> column the [index](https://pandas.pydata.org/docs/user_guide/indexing.html) of the dataframe and sort it.  The index is how pandas looks up rows, so building it once here means the join in Step 7 can use it directly. 
+# 
+# We'll keep the tract geometries in the projection they come in (NAD83, EPSG 4269) for now.  Reprojecting moves every single point of every tract boundary, so we will wait until Step 9, when there are only 62 county boundaries left to reproject.
 # 
 # After that, it's time to create a geodataframe to hold this data.  To make sure we've done this right, you're going to print the headers and the first 5 rows, as well as the data projection, as the output of this cell.
 
 # In[9]:
 
 
-# Access shapefile of New York census tracts
-ny_tract = gpd.read_file("https://www2.census.gov/geo/tiger/TIGER2019/TRACT/tl_2019_36_tract.zip")
+def _cached_download(url, cache_dir = CACHE_DIR):
+    """Download url into cache_dir the first time it is asked for, and return the path of the local copy."""
+    def download(path):
+        # Stream the file to disk in 1 MB pieces through the shared session
+        # Source: https://requests.readthedocs.io/en/latest/user/advanced/#body-content-workflow
+        with session.get(url, stream = True, timeout = 60) as response:
+            response.raise_for_status()
+            with open(path, "wb") as file:
+                for chunk in response.iter_content(chunk_size = 1 << 20):
+                    file.write(chunk)
+
+    local_path = cache_dir / Path(url).name
+    if not local_path.exists():
+        _atomic_write(local_path, download)
+    return local_path
+
 
-# Reproject shapefile to UTM Zone 18N
-# https://spatialreference.org/ref/epsg/wgs-84-utm-zone-18n/
-ny_tract = ny_tract.to_crs(epsg = 32618)
+def read_cached_file(url, columns = None):
+    """Read a spatial file from the web, keeping a GeoParquet copy in CACHE_DIR for later runs."""
+    # Each set of columns gets its own copy, since the copy only holds the columns that were asked for
+    key = repr((url, None if columns is None else tuple(columns)))
+    cache_path = CACHE_DIR / "{}.parquet".format(hashlib.md5(key.encode()).hexdigest())
+    if not cache_path.exists():
+        # Only read the columns we asked for (and the geometry) out of the shapefile; GDAL skips the rest
+        # Source: https://pyogrio.readthedocs.io/en/latest/introduction.html
+        gdf = gpd.read_file(_cached_download(url), columns = columns, engine = "pyogrio", use_arrow = True)
+        _atomic_write(cache_path, gdf.to_parquet)
 
-# Print GeoDataFrame of shapefile
-print(ny_tract.head(5))
-print('Shape: ', ny_tract.shape)
+    # Source: https://geopandas.org/en/stable/docs/reference/api/geopandas.read_parquet.html
+    return gpd.read_parquet(cache_path)
 
-# Check shapefile projection
-print("\nThe shapefile projection is: {}".format(ny_tract.crs))
+
+# Access shapefile of New York census tracts, reading only the columns we will use
+TRACT_URL = "https://www2.census.gov/geo/tiger/TIGER2019/TRACT/tl_2019_36_tract.zip"
+ny_tract = read_cached_file(TRACT_URL, columns = ["COUNTYFP", "GEOID"])
+
+# Use the sorted GEOID as the index, so that it's ready to join the census data on later
+ny_tract = ny_tract.set_index("GEOID").sort_index()
+
+# The 4918 tracts only have 62 different county codes, so store them as a category (see Step 6)
+ny_tract["COUNTYFP"] = ny_tract["COUNTYFP"].astype("category")
+
+if DEBUG:
+    # Print GeoDataFrame of shapefile
+    print(ny_tract.head(5))
+    print('Shape: ', ny_tract.shape)
+
+    # Check shapefile projection
+    print("\nThe shapefile projection is: {}".format(ny_tract.crs.to_string()))
 
 
 # We can see that the shapefile also has 4918 rows (4918 tracts). This number matches with the number of census records that we have on file, which means we are using the correct file and will have a one-to-one match for our rows (hopefully).
@@ -161,18 +319,18 @@ print("\nThe shapefile projection is: {}".format(ny_tract.crs))
 # 
 # We can join the two dataframes together via a field or column that is common to both dataframes, which is referred to as a key.
 # 
-# Looking at the two datasets above, it appears that the GEOID column from ny_tract and the state, county, and tract columns combined from ny_df could serve as the unique key for joining these two dataframes together. In their current forms, this join will not be successful, as we’ll need to merge the state, county, and tract columns from ny_df together to make it parallel to the GEOID column from ny_tract. We can simply add the columns together, much like math or the basic operators in Python, and assign the “sum” to a new column.
+# Looking at the two datasets above, it appears that the GEOID column from ny_tract and the GEOID column from ny_df could serve as the unique key for joining these two dataframes together. The API doesn't actually send a GEOID: it sends the state, county, and tract codes as three separate columns, and a GEOID is just those three codes written one after the other (36 + 001 + 000100 = 36001000100).  We could add the three columns together after building the dataframe, much like math or the basic operators in Python, but every <b>+</b> builds a whole new column of strings along the way.  Instead, <span style="color:red">get_census_tracts</span> combined the three codes for each row while it was reading the API response in Step 2, and assigned the result to a new column, stored as a <span style="color:red">category</span> (more on that in Step 6).
 # 
 # To create a new column–or call an existing column in a dataframe–we can use indexing with <b>[]</b> and the column name (string). You can also access columns using the index number (which we are not doing here), but you can read more about indexing and selecting data [in the pandas documentation](https://pandas.pydata.org/pandas-docs/stable/user_guide/indexing.html).)
 
 # In[10]:
 
 
-# Combine state, county, and tract columns together to create a new string and assign to new column
-ny_df["GEOID"] = ny_df["state"] + ny_df["county"] + ny_df["tract"]
+# The GEOID column was created from the state, county, and tract codes in Step 2
+ny_df["GEOID"].head(5)
 
 
-# Printing out the first rew rows of the dataframe, we can see that the new column GEOID has been created with the values from the three columns combined.
+# Printing out the first rew rows of the dataframe, we can see that the GEOID column holds the values from the three codes combined, and that there are no separate <span style="color:red">state</span>, <span style="color:red">county</span>, and <span style="color:red">tract</span> columns.
 
 # In[11]:
 
@@ -183,30 +341,39 @@ ny_df.head(5)
 
 # ## Step 5: Remove dataframe columns that are no longer needed
 # 
-# To reduce clutter, we can delete the <span style="color:red">state</span>, <span style="color:red">county</span>, and <span style="color:red">tract</span> columns from <span style="color:red">ny_df</span> since we don’t need them anymore. Remember that when we want to modify a dataframe, we must assign the modified dataframe back to the original variable (or a new one, if preferred). Otherwise, any modifications won’t be saved. An alternative to assigning the dataframe back to the variable is to simply pass <span style="color:red">inplace = True</span>. For more information, see the [pandas help documentation on drop](https://pandas.pydata.org/docs/reference/api/pandas.DataFrame.drop.html).
+# To reduce clutter, we only want to keep the columns that we will use from here on.  We have already taken care of that while reading the data in: <span style="color:red">get_census_tracts</span> only asked the API for the three count columns (not even <span style="color:red">NAME</span>), the <span style="color:red">state</span>, <span style="color:red">county</span>, and <span style="color:red">tract</span> codes never made it into the dataframe as separate columns, and <span style="color:red">read_cached_file</span> only read the <span style="color:red">COUNTYFP</span> and <span style="color:red">GEOID</span> columns and the geometry of the shapefile.  Dropping columns before the join in Step 7 (instead of afterwards) means the join never has to copy data we will never use.  If you ever do read in more than you need, you can select the columns to keep (<span style="color:red">ny_df = ny_df[[...]]</span>); if you would rather list the columns to remove instead, see the [pandas help documentation on drop](https://pandas.pydata.org/docs/reference/api/pandas.DataFrame.drop.html).  Remember that when we want to modify a dataframe, we must assign the modified dataframe back to the original variable (or a new one, if preferred). Otherwise, any modifications won’t be saved.
 
 # In[12]:
 
 
-# Remove columns
-ny_df = ny_df.drop(columns = ["state", "county", "tract"])
-
-# Show updated dataframe
-ny_df.head(5)
+if DEBUG:
+    # Show the columns left in both dataframes
+    print(list(ny_df.columns))
+    print(list(ny_tract.columns))
 
 
 # ## Step 6: Check column data types
 # 
-# The key in both dataframe must be of the same data type. Let’s check the data type of the <span style="color:red">GEOID</span> columns in both dataframes. If they aren’t the same, we will have to change the data type of columns to make them the same.
+# The key in both dataframe must be of the same data type. Let’s check the data type of the <span style="color:red">GEOID</span> columns in both dataframes (for <span style="color:red">ny_tract</span>, that's the index). If they aren’t the same, we will have to change the data type of columns to make them the same.
+# 
+# While we're at it, we will store <span style="color:red">GEOID</span> as the pandas <span style="color:red">category</span> data type, just like <span style="color:red">COUNTYFP</span> (which we already converted right after reading the shapefile in Step 3). A category column keeps each distinct value once and stores every row as a small integer code, so joining and grouping compare integers instead of whole strings. Both <span style="color:red">GEOID</span> columns get the same list of categories, so their codes line up. For more information, see the [pandas documentation on categorical data](https://pandas.pydata.org/docs/user_guide/categorical.html).
 
 # In[13]:
 
 
-# Check column data types for census data
-print("Column data types for census data:\n{}".format(ny_df.dtypes))
+# Store the join and grouping keys as categories
+# (Index.union returns the GEOIDs of both dataframes once each, already sorted)
+geoid_dtype = pd.CategoricalDtype(ny_df["GEOID"].cat.categories.union(ny_tract.index))
+ny_df["GEOID"] = ny_df["GEOID"].astype(geoid_dtype)
+ny_tract.index = ny_tract.index.astype(geoid_dtype)
 
-# Check column data types for census shapefile
-print("\nColumn data types for census shapefile:\n{}".format(ny_tract.dtypes))
+if DEBUG:
+    # Check column data types for census data
+    print("Column data types for census data:\n{}".format(ny_df.dtypes))
+
+    # Check column data types for census shapefile (GEOID is its index)
+    print("\nColumn data types for census shapefile:\n{}".format(ny_tract.dtypes))
+    print("GEOID (index): {}".format(ny_tract.index.dtype))
 
 # Source: https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.dtypes.html
 
@@ -215,94 +382,240 @@ print("\nColumn data types for census shapefile:\n{}".format(ny_tract.dtypes))
 # 
 # ## Step 7: Merge dataframes
 # 
-# Now, we are ready to merge the two dataframes together, using the <span style="color:red">GEOID</span> columns as the primary key. We can use the <span style="color:red">merge</span> method in <span style="color:red">GeoPandas</span> called on the <span style="color:red">ny_tract</span> shapefile dataset.
+# Now, we are ready to merge the two dataframes together, using the <span style="color:red">GEOID</span> columns as the primary key. <span style="color:red">GEOID</span> is already the index of <span style="color:red">ny_tract</span>, so we make it the index of <span style="color:red">ny_df</span> as well with <span style="color:red">set_index</span>, and then use the <span style="color:red">join</span> method called on the <span style="color:red">ny_tract</span> shapefile dataset. Joining on the index is faster than merging on a column, because pandas can look the rows up in the index it already built instead of hashing both columns again. Passing <span style="color:red">validate = "1:1"</span> makes pandas raise an error if a <span style="color:red">GEOID</span> shows up more than once on either side.
 
 # In[14]:
 
 
+# Use GEOID as the index of the census data too
+ny_df = ny_df.set_index("GEOID")
+
 # Join the attributes of the dataframes together
-# Source: https://geopandas.org/docs/user_guide/mergingdata.html
-ny_merge = ny_tract.merge(ny_df, on = "GEOID")
+# Source: https://geopandas.org/docs/user_guide/mergingdata.html; https://pandas.pydata.org/docs/reference/api/pandas.DataFrame.join.html
+ny_poverty_tract = ny_tract.join(ny_df, how = "inner", validate = "1:1")
 
-# Show result
-print(ny_merge.head(5))
-print('Shape: ', ny_merge.shape)
+if DEBUG:
+    # Show result
+    print(ny_poverty_tract.head(5))
+    print('Shape: ', ny_poverty_tract.shape)
 
 
-# We still have 4918 rows, which means that all rows (or most of them) were successfully matched! Notice how the census data has been added on after the shapefile data in the dataframe.
+# We still have 4918 rows, which means that all rows (or most of them) were successfully matched! Notice how the census data has been added on after the shapefile data in the dataframe.  We are left with 5 columns: the county code, the geometry, and the counts to add up, which is all the next step needs. <span style="color:red">GEOID</span> is still there as the index (the joined dataframe would have had 18 columns if we had read every column of the shapefile and kept every census column).  Since we removed the columns we didn't need before joining (Step 5), there is nothing left to clean up afterwards.
 # 
 # Some additional notes about joining dataframes:
 # 
-# - the columns for the key do not need to have the same name.
+# - the columns for the key do not need to have the same name (with <span style="color:red">merge</span>, use <span style="color:red">left_on</span> and <span style="color:red">right_on</span>).
 # - for this join, we had a one-to-one relationship, meaning one attribute in one dataframe matched to one (and only one) attribute in the other dataframe. Joins with a many-to-one, one-to-many, or many-to-many relationship are also possible, but in some cases, they require some special considerations. See this [Esri ArcGIS help documentation on joins and relates for more information](https://desktop.arcgis.com/en/arcmap/10.3/manage-data/tables/about-joining-and-relating-tables.htm).
 # 
-# ## Step 8: Subset dataframe
+# ## Step 8: Get summarized statistics and poverty rates at the county level
+# 
+# Next, we will group all the census tracts within the same county (<span style="color:red">COUNTYFP</span>) and aggregate the poverty and population values for those tracts within the same county with the pandas <span style="color:red">groupby</span> function.
+# 
+# We can then estimate the poverty rate by dividing the sum of <b>C17002_002E</b> (ratio of income to poverty in the past 12 months, < 0.50) and <b>C17002_003E</b> (ratio of income to poverty in the past 12 months, 0.50 - 0.99) by <b>B01003_001E</b> (total population).
 # 
-# Now that we merged the dataframes together, we can further clean up the dataframe and remove columns that are not needed. Instead of using the <span style="color:red">drop</span> method, we can simply select the columns we want to keep and create a new dataframe with those selected columns.
+# Side note: The same table also has <b>C17002_001E</b> (ratio of income to poverty in the past 12 months, total), which theoretically should count everyone, but does not exactly match up with <b>B01003_001E</b> (total population). We’ll disregard this for now since the difference is not too significant, and since we divide by the total population we don't download <b>C17002_001E</b> at all.  Add it back to the list of variables in Step 2 if you want to compare the two.
+# 
+# We put these two operations in a function, <span style="color:red">compute_county_rates</span>, so that they can be reused with other states. Notice that it returns a plain dataframe: computing the poverty rates doesn't need the county geometries at all.
+# 
+# The math itself lives in <span style="color:red">poverty_rate</span>.  It works on plain numpy arrays and writes every step (the <b>+</b>, the <b>*</b>, and the <b>/</b>) into the same result array, instead of building a whole new column for each one.  Since it only ever sees one row per county (62 for New York, about 3,200 for the whole country), this takes well under a millisecond.  The rates are stored as 32-bit decimal numbers (<span style="color:red">float32</span>), which is more than precise enough for a percentage and half the size of pandas' default.
 
-# In[15]:
+# In[16]:
 
 
-# Create new dataframe from select columns
-ny_poverty_tract = ny_merge[["STATEFP", "COUNTYFP", "TRACTCE", "GEOID", "geometry", "C17002_001E", "C17002_002E", "C17002_003E", "B01003_001E"]]
+def poverty_rate(below_half, below_one, population):
+    """Percent of the population with an income below the poverty line."""
+    # 32-bit floats hold a percentage to about 7 significant digits, and halve the memory the math has to move
+    below_half = np.ascontiguousarray(below_half, dtype = np.float32)
+    below_one = np.ascontiguousarray(below_one, dtype = np.float32)
+    population = np.ascontiguousarray(population, dtype = np.float32)
 
-# Show dataframe
-print(ny_poverty_tract.head(5))
-print('Shape: ', ny_poverty_tract.shape)
+    # Reuse one result array for all three operations instead of making a new one for each
+    out = np.add(below_half, below_one)
+    np.multiply(out, np.float32(100), out = out)
+    np.divide(out, population, out = out)
+    return out
 
 
-# Notice how the number of columns dropped from 18 to 9.
-# 
-# ## Step 9: Dissolve geometries and get summarized statistics to get poverty statistics at the county level
-# 
-# Next, we will group all the census tracts within the same county (<span style="color:red">COUNTYFP</span>) and aggregate the poverty and population values for those tracts within the same county. We can use the <span style="color:red">dissolve</span> function in <span style="color:red">GeoPandas</span>, which is the spatial version of <span style="color:red">groupby</span> in pandas. We use <span style="color:red">dissolve</span> instead of <span style="color:red">groupby</span> because the former also groups and merges all the geometries (i.e. census tracts) within a given group (i.e. counties).
+def compute_county_rates(tracts):
+    """Add up the tract counts within each county and compute the poverty rate (%)."""
+    counts = tracts[["C17002_002E", "C17002_003E", "B01003_001E"]]
 
-# In[16]:
+    # Leave a tract with any count missing out of all three sums, so that its population isn't counted without its poverty counts
+    # Source: https://pandas.pydata.org/docs/reference/api/pandas.DataFrame.where.html
+    complete = counts.notna().all(axis = 1)
+    if not complete.all():
+        counts = counts.astype("Int32").where(complete, axis = 0)
 
+    # min_count = 1 leaves a county with no complete tracts at all as missing, instead of 0
+    # Source: https://pandas.pydata.org/docs/user_guide/groupby.html
+    county = counts.groupby(tracts["COUNTYFP"], sort = False, observed = True).sum(min_count = 1)
 
-# Dissolve and group the census tracts within each county and aggregate all the values together
-# Source: https://geopandas.org/docs/user_guide/aggregation_with_dissolve.html
-ny_poverty_county = ny_poverty_tract.dissolve(by = 'COUNTYFP', aggfunc = 'sum')
+    # Get poverty rate and store values in new column (missing counts become NaN, so their rate is NaN too)
+    county["Poverty_Rate"] = poverty_rate(*(county[name].to_numpy(dtype = np.float32, na_value = np.nan) for name in ("C17002_002E", "C17002_003E", "B01003_001E")))
+    return county
 
-# Show dataframe
-print(ny_poverty_county.head(5))
-print('Shape: ', ny_poverty_county.shape)
 
+ny_county_rates = compute_county_rates(ny_poverty_tract)
+
+if DEBUG:
+    # Show dataframe
+    print(ny_county_rates.head(5))
+    print('Shape: ', ny_county_rates.shape)
 
-# Notice that we got the number of rows down from 4918 to 62.
+
+# Notice that we got the number of rows down from 4918 to 62. If all you need is a table of poverty rates, you can stop here!
+# 
+# ## Step 9: Dissolve geometries to get the county boundaries
 # 
-# ## Step 10: Perform column math to get poverty rates
+# To map (or export) the poverty rates, we also need one geometry per county. <span style="color:red">GeoPandas</span> has a <span style="color:red">dissolve</span> function, which is the spatial version of <span style="color:red">groupby</span> in pandas: it groups the rows, adds up the values, and merges all the geometries (i.e. census tracts) within a given group (i.e. counties). Since we already have the county totals, we only need the geometry half of that work, so <span style="color:red">build_county_geometry</span> merges the tract geometries within each county with <span style="color:red">shapely.coverage_union_all</span>, passing it all of a county's tracts at once as a single array.  Since each county can be merged without knowing anything about the others, we merge several counties at the same time, one per CPU core. Merging geometries is by far the slowest part of this workshop, which is why we only do it when we need a map or a file.  (<span style="color:red">shapely.union_all</span>, the [shapely 2.0](https://shapely.readthedocs.io/en/stable/release/2.x.html) name for <span style="color:red">unary_union</span>, can merge any shapes at all, so it has to check every tract against its neighbors to find where they overlap.  Census tracts never overlap: they fit together like the pieces of a puzzle, which is called a <i>coverage</i>.  <span style="color:red">coverage_union_all</span> takes advantage of that and just removes the edges that neighboring tracts share, which is much faster.  It only works if the tracts really do fit together exactly, so <span style="color:red">build_county_geometry</span> checks that first with <span style="color:red">shapely.coverage_is_valid</span> (or, with shapely older than 2.1, checks each merged county), and uses <span style="color:red">union_all</span> instead whenever they don't.)
 # 
-# We can estimate the poverty rate by dividing the sum of <b>C17002_002E</b> (ratio of income to poverty in the past 12 months, < 0.50) and <b>C17002_003E</b> (ratio of income to poverty in the past 12 months, 0.50 - 0.99) by <b>B01003_001E</b> (total population).
+# The tract boundaries from the Census Bureau follow every bend of every road and river, so they have thousands of points each, and merging takes longer the more points there are.  None of that detail shows up on a map of the whole state, so <span style="color:red">build_county_geometry</span> first simplifies the tracts.  It drops the points that make the least difference to the shape: a point is removed when the little triangle it forms with the points on either side of it covers less area than <span style="color:red">SIMPLIFY_TOLERANCE</span> squared (0.0005 degrees, so roughly a triangle of 50 by 50 meters).  Because the tolerance is about area rather than distance, a long, narrow spike (such as a thin strip of land along a river) can be cut off entirely, so the simplified boundary can end up a few hundred meters away from the original in places; on a map of the whole state you can't see the difference.  It uses <span style="color:red">shapely.coverage_simplify</span>, which simplifies all the tracts together: simplifying each tract on its own would move the shared edge of two neighbors differently, leaving thin gaps and overlaps between them that would show up in the merged counties.  <span style="color:red">coverage_simplify</span> needs shapely 2.1 or newer; with older versions the tracts are merged as they are.  Pass <span style="color:red">tolerance = 0</span> if you need the exact boundaries.
 # 
-# Side note: Notice that <b>C17002_001E</b> (ratio of income to poverty in the past 12 months, total), which theoretically should count everyone, does not exactly match up with <b>B01003_001E</b> (total population). We’ll disregard this for now since the difference is not too significant.
+# This is also where we reproject the spatial data into the UTM Zone 18N (also known as EPSG 32618) projection (because this will allow us to project the entire state of New York, instead of just a particular section).  Reprojecting has to work out the new position of every single point, so we do it last: after simplifying (which leaves far fewer points) and merging (which removes the points along the borders between tracts in the same county), there is much less work left than there would be for the 4918 original tracts.  At the size of our map, you can't tell the difference between reprojecting first and reprojecting last.
+# 
+# Like the census data and the shapefile, the merged county geometries are saved in the <span style="color:red">CACHE_DIR</span> folder by <span style="color:red">cached_county_geometry</span>, named after everything they depend on (the shapefile link, exactly which tracts went in, the simplification tolerance, and the projection).  The next time you run this step with the same settings, the county boundaries are read straight from that copy and nothing has to be merged again.  If you change any of them (for example, by only asking for some counties in Step 2), the counties are merged again.  Only the boundaries are saved: the poverty rates from Step 8 are always joined back on fresh, so they can never come from an older run.
 
 # In[17]:
 
 
-# Get poverty rate and store values in new column
-ny_poverty_county["Poverty_Rate"] = (ny_poverty_county["C17002_002E"] + ny_poverty_county["C17002_003E"]) / ny_poverty_county["B01003_001E"] * 100
+# How much to simplify the tract boundaries before merging: points are removed while the triangle they make with their
+# neighbors covers less than this tolerance squared (in degrees, so 0.0005 is a triangle of roughly 50 x 50 meters)
+SIMPLIFY_TOLERANCE = 0.0005
+
+
+def _merge_coverage(geometries):
+    """Merge tracts that fit together without overlapping, falling back to a general union if they don't."""
+    # Source: https://shapely.readthedocs.io/en/stable/reference/shapely.coverage_union_all.html
+    try:
+        merged = shapely.coverage_union_all(geometries)
+        if shapely.is_valid(merged):
+            return merged
+    except GEOSException:
+        pass
+    # Source: https://shapely.readthedocs.io/en/stable/reference/shapely.union_all.html
+    return shapely.union_all(geometries)
+
+
+def build_county_geometry(tracts, tolerance = SIMPLIFY_TOLERANCE):
+    """Merge the tract geometries within each county into one county geometry."""
+    geometries = tracts.geometry.to_numpy()
+
+    # Simplify all the tracts together, so that neighboring tracts still share exactly the same edge afterwards
+    # Source: https://shapely.readthedocs.io/en/stable/reference/shapely.coverage_simplify.html
+    if tolerance and hasattr(shapely, "coverage_simplify"):
+        geometries = shapely.coverage_simplify(geometries, tolerance)
+
+    # If the tracts fit together without overlapping or leaving gaps, shapely only has to remove the edges they share;
+    # otherwise (or if we can't check, before shapely 2.1) fall back to the general union for any county where that fails
+    # Source: https://shapely.readthedocs.io/en/stable/reference/shapely.coverage_is_valid.html
+    if hasattr(shapely, "coverage_is_valid") and not shapely.coverage_is_valid(geometries):
+        merge = shapely.union_all
+    else:
+        merge = _merge_coverage
+
+    # Look up which rows belong to each county once, then hand shapely each county's geometries as one array
+    county_rows = tracts.groupby("COUNTYFP", sort = False, observed = True).indices
+
+    # Each county is independent, and shapely lets other threads run while it works, so merge several counties at once
+    # Source: https://docs.python.org/3/library/concurrent.futures.html#threadpoolexecutor
+    with ThreadPoolExecutor(max_workers = os.cpu_count()) as pool:
+        unions = list(pool.map(merge, (geometries[rows] for rows in county_rows.values())))
+
+    return gpd.GeoSeries(unions,
+                         index = pd.Index(county_rows.keys(), name = "COUNTYFP"),
+                         name = "geometry",
+                         crs = tracts.crs)
+
+
+def cached_county_geometry(tracts, source, tolerance = SIMPLIFY_TOLERANCE, epsg = 32618):
+    """Merge and reproject the county geometries of tracts, keeping a GeoParquet copy in CACHE_DIR for later runs."""
+    # The counties depend on the tract file, which of its tracts we use, and how they are simplified and projected
+    simplified = bool(tolerance) and hasattr(shapely, "coverage_simplify")
+    tract_ids = hashlib.md5("\n".join(tracts.index.astype(str)).encode()).hexdigest()
+    key = repr((source, tract_ids, tolerance if simplified else 0, epsg))
+    cache_path = CACHE_DIR / "county_{}.parquet".format(hashlib.md5(key.encode()).hexdigest())
+    if cache_path.exists():
+        return gpd.read_parquet(cache_path).geometry
+
+    # Reproject county geometries to UTM Zone 18N, now that they have been simplified and merged
+    # https://spatialreference.org/ref/epsg/wgs-84-utm-zone-18n/
+    counties = build_county_geometry(tracts, tolerance).to_crs(epsg = epsg)
+
+    _atomic_write(cache_path, counties.to_frame().to_parquet)
+    return counties
+
+
+ny_county_geometry = cached_county_geometry(ny_poverty_tract, TRACT_URL)
+
+# Put the county poverty rates (always freshly computed in Step 8) and geometries together
+# Source: https://geopandas.org/docs/user_guide/aggregation_with_dissolve.html
+ny_poverty_county = gpd.GeoDataFrame(ny_county_rates.join(ny_county_geometry), geometry = "geometry", crs = ny_county_geometry.crs)
 
 # Show dataframe
 ny_poverty_county.head(5)
 
 
-# ## Step 11: Plotting Results
+# ## Step 10: Plotting Results
 # 
 # Finally, since we have the spatial component connected to our census data, we can plot the results! Note: You can change the color palette by changing the value of the color map (<span style="color:red">cmap</span>).  You can find a list [here](https://matplotlib.org/stable/tutorials/colors/colormaps.html).
+# 
+# Drawing a map with <span style="color:red">plot</span> takes longer the more shapes (and points along their boundaries) there are.  For our 62 counties that's no problem, but a map of every tract in the country would take a long time to draw.  <span style="color:red">plot_choropleth</span> uses <span style="color:red">plot</span> for small maps, and if you have [datashader](https://datashader.org/) installed, it draws big maps (<span style="color:red">DATASHADER_MIN_SHAPES</span> shapes or more) as a single image instead, which takes about the same time however many shapes there are.
+# 
+# Instead of giving every county its own shade, <span style="color:red">plot_choropleth</span> sorts the poverty rates into 5 classes (<span style="color:red">scheme = "Quantiles", k = 5</span>) with the [mapclassify](https://pysal.org/mapclassify/) library, so that each class has the same number of counties and its own color.  Five colors are easier to tell apart on a map than a smooth range of shades, and the legend shows the range of poverty rates in each class.  You can try other schemes, such as <span style="color:red">"EqualInterval"</span> or <span style="color:red">"NaturalBreaks"</span>, or pass <span style="color:red">scheme = None</span> to get the smooth range of shades back.  (Maps drawn with datashader always use the smooth range.)
+# 
+# If you save the map with <span style="color:red">fig.savefig</span> as a PDF or SVG, matplotlib would normally write out every point of every county boundary.  <span style="color:red">plot_choropleth</span> asks for the county shapes to be saved as a single image instead (<span style="color:red">rasterized = True</span>), while the title, legend, and axes stay sharp, which keeps the file small and quick to open.
 
 # In[18]:
 
 
+# Maps with at least this many shapes are drawn with datashader (if it is installed)
+DATASHADER_MIN_SHAPES = 10000
+
+
+def _plot_datashader(gdf, column, ax, cmap):
+    """Draw gdf colored by its value in column as a single image with datashader."""
+    # datashader takes a moment to import, so only import it once a map is big enough to need it
+    import datashader as ds # draws maps with very many shapes as a single image
+    import datashader.transfer_functions as tf
+
+    # Source: https://datashader.org/user_guide/Polygons.html
+    xmin, ymin, xmax, ymax = gdf.total_bounds
+    canvas = ds.Canvas(plot_width = 1600,
+                       plot_height = int(1600 * (ymax - ymin) / (xmax - xmin)),
+                       x_range = (xmin, xmax),
+                       y_range = (ymin, ymax))
+    values = canvas.polygons(gdf, geometry = "geometry", agg = ds.mean(column))
+    image = tf.shade(values, cmap = plt.get_cmap(cmap), how = "linear")
+    ax.imshow(image.to_pil(), extent = (xmin, xmax, ymin, ymax))
+    ax.figure.colorbar(plt.cm.ScalarMappable(norm = plt.Normalize(float(values.min()), float(values.max())), cmap = cmap), ax = ax)
+
+
+def plot_choropleth(gdf, column, ax, cmap, scheme = "Quantiles", k = 5):
+    """Color each shape in gdf by its value in column, drawing large maps as a single image."""
+    # Source: https://docs.python.org/3/library/importlib.html#importlib.util.find_spec
+    if len(gdf) < DATASHADER_MIN_SHAPES or importlib.util.find_spec("datashader") is None:
+        # Sort the values into k classes with mapclassify, so the map only uses k colors
+        # Source: https://geopandas.readthedocs.io/en/latest/docs/user_guide/mapping.html#choosing-colors
+        gdf.plot(column = column,
+                 ax = ax,
+                 cmap = cmap,
+                 scheme = scheme,
+                 k = k,
+                 legend = True,
+                 rasterized = True,
+                 zorder = 0)
+        # Draw everything below zorder 1 (the county shapes) as one image when the figure is saved as a PDF or SVG
+        # Source: https://matplotlib.org/stable/gallery/misc/rasterization_demo.html
+        ax.set_rasterization_zorder(1)
+    else:
+        _plot_datashader(gdf, column, ax, cmap)
+
+
 # Create subplots
-fig, ax = plt.subplots(1, 1, figsize = (20, 10))
+fig, ax = plt.subplots(1, 1, figsize = (20, 10), subplot_kw = {"aspect": "equal"})
 
 # Plot data
-# Source: https://geopandas.readthedocs.io/en/latest/docs/user_guide/mapping.html
-ny_poverty_county.plot(column = "Poverty_Rate",
-                       ax = ax,
-                       cmap = "coolwarm",
-                       legend = True)
+plot_choropleth(ny_poverty_county, "Poverty_Rate", ax, "coolwarm")
 
 # Stylize plots
 plt.style.use('bmh')
@@ -311,43 +624,51 @@ plt.style.use('bmh')
 ax.set_title('Poverty Rates (%) in New York State (2020 American Community Survey)', fontdict = {'fontsize': '18', 'fontweight' : '3'})
 
 
-# ## Step 12: Write your data to a shapefile
+# ## Step 11: Write your data to a file
 # 
-# Now that you've done all this great work, you will want to export it as a file.  We can use the <span style="color:red">gpd.to_file()</span> function for this.  I'll be using shapefiles (since this is the default output file format), but you can use export to a database/online repository as well, and change the file format to other compatible ones by typing in <span style="color:red">fiona.supported_drivers</span> into a code line.
+# Now that you've done all this great work, you will want to export it as a file.  We can use the <span style="color:red">to_parquet()</span> and <span style="color:red">to_file()</span> functions for this.  I'll be using [GeoParquet](https://geoparquet.org/) as the main output: it is a single, compressed file that stores each column (including the geometry) as one block, is much faster to write than a shapefile, and doesn't cut column names down to 10 characters (so <span style="color:red">Poverty_Rate</span> stays <span style="color:red">Poverty_Rate</span>).  QGIS, ArcGIS Pro, and DuckDB can all open it.  You can also export to a database/online repository, and change the file format to other compatible ones by typing in <span style="color:red">pyogrio.list_drivers()</span> into a code line.
 # 
 # First, you will want to create an output path to store your data if one does not exist.  If does exist, you will overwrite that directory.  Doing so is not automatic--you will need to set the parameter <span style="color:red">exist_ok = True</span> to suppress the error message and overwrite the directory.  NOTE: For simplicity, I just created a directory the old fashioned way.
 # 
 # Then, you will want to set up some error handling to make sure the file directory is created.  When an error(exception) occurs, Python will generate an error message and the program will crash.  We can handle these errors using the <span style="color:red">try</span> statement. This way, instead of the program crashing, the <span style="color:red">except</span> block will be executed.  You can define as many exception blocks as you'd like.  You can use <span style="color:red">else</span> to define code to be executed if no errors are raised.  Another good practice is to define a <span style="color:red">finally</span> block, which will be executed regardless of any error.  <span style="color:red">Finally</span> is often used to clean up resources and close objects when the script is done. 
 # 
-# After that, just write the file to the directory.  The variable <span style="color:red">ny_poverty_county</span> contains all the data we want to export, so we will replace "gpd" with "ny_poverty_county" to get <span style="color:red">ny_poverty_county.to_file</span>.  NOTE: I needed to use the <span style="color:red">encoding='utf-8'</span> parameter.  I've not seen this in all code samples, so be aware that you might need this as well.
+# After that, just write the file to the directory.  The variable <span style="color:red">ny_poverty_county</span> contains all the data we want to export, so we call <span style="color:red">ny_poverty_county.to_parquet</span>.  The <span style="color:red">try</span> and <span style="color:red">except</span> blocks live in <span style="color:red">write_output</span>, so every file gets the same error handling, and since the files don't depend on each other, we write all three at the same time (most of the writing happens outside of Python, so the threads don't have to wait for each other).
 #  
-# Shapefile is the default output, but you can set other outputs. You need to be careful when changing the default output type--they require different levels of finesse to get them to work correctly. Below are some examples. When exporting to GeoJSON, the file extension changed to .json, and the parameter driver='GeoJSON' was included. However, when exporting to csv, ny_poverty_county.to_file() changed to ny_poverty_county.to_csv(). Also note that in the csv example below, the geometry was removed using the drop function.
+# You can set other outputs as well. You need to be careful when changing the output type--they require different levels of finesse to get them to work correctly. Below are some examples. When exporting to [FlatGeobuf](https://flatgeobuf.org/), we used <span style="color:red">pyogrio.write_dataframe</span> (which is what ny_poverty_county.to_file() calls behind the scenes), the file extension changed to .fgb, and the parameter driver='FlatGeobuf' was included.  FlatGeobuf is a compact binary format that (unlike GeoJSON) doesn't have to write every coordinate out as text, so it is much smaller and faster to write and read, and QGIS and ArcGIS Pro can open it just like a shapefile.  If you need GeoJSON (for example, for a web map), change the file extension to .json and use <span style="color:red">driver='GeoJSON'</span> instead.  NOTE: I needed to use the <span style="color:red">encoding='utf-8'</span> parameter for GeoJSON.  I've not seen this in all code samples, so be aware that you might need this as well.  When exporting to csv, ny_poverty_county.to_file() changed to ny_poverty_county.to_csv(). Also note that in the csv example below, the geometry was removed using the drop function.  If you need a shapefile, change the file extension to .shp in the FlatGeobuf example and leave out the driver parameter.
 # 
 # ### <span style="color:green">Note: You will need to add a directory location to get this to work.  I've removed mine below.</span>
 
 # In[19]:
 
 
-try:
-    ny_poverty_county.to_file(r"\\insert\your\directory\here.shp", encoding='utf-8')
-    print("Shapefile successfully written to directory")
-except OSError as error:
-    print ("Shapefile cannot be written to directory")
+def write_output(kind, write, path):
+    """Write one output file with write(path), and return a message saying whether it worked."""
+    try:
+        write(path)
+        return "{} successfully written to directory".format(kind)
+    # pyogrio reports files it cannot create with its own errors instead of OSError
+    except (OSError, DataSourceError, DataLayerError) as error:
+        return "{} cannot be written to directory".format(kind)
+
 
-# Write data to topojson
+# Remove the geometry once for the csv file; the county codes stay in the index
+ny_poverty_attributes = ny_poverty_county.drop(columns = "geometry")
 
-try:
-    ny_poverty_county.to_file(r"\\insert\your\directory\here.json", driver='GeoJSON', encoding='utf-8')
-    print("GeoJson file successfully written to directory")
-except OSError as error:
-    print ("GeoJson file cannot be written to directory")
+outputs = [
+    # Write data to GeoParquet
+    ("GeoParquet file", ny_poverty_county.to_parquet, r"\\insert\your\directory\here.parquet"),
+    # Write data to FlatGeobuf
+    # Source: https://pyogrio.readthedocs.io/en/latest/api.html#pyogrio.write_dataframe
+    ("FlatGeobuf file", lambda path: pyogrio.write_dataframe(ny_poverty_county.reset_index(), path, driver = "FlatGeobuf"), r"\\insert\your\directory\here.fgb"),
+    # Write data to csv
+    ("CSV", lambda path: ny_poverty_attributes.to_csv(path, encoding = 'utf-8'), r"\\insert\your\directory\here.csv"),
+]
 
-# Write data to csv
+# Each file is written separately, so write all three at the same time and print each message as soon as its file is done
+# Source: https://docs.python.org/3/library/concurrent.futures.html#concurrent.futures.as_completed
+with ThreadPoolExecutor() as pool:
+    for future in as_completed([pool.submit(write_output, *output) for output in outputs]):
+        print(future.result())
 
-try:
-    ny_poverty_county.drop('geometry',axis=1).to_csv(r"\\insert\your\directory\here.csv", encoding='utf-8')   
-    print("CSV successfully written to directory")
-except OSError as error:
-    print ("CSV cannot be written to directory")   
 
 # # Thanks for giving me the opportunity to teach you all!  I hope you enjoyed it!